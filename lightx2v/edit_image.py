@@ -1,104 +1,245 @@
 """
 Qwen-Image-Edit-2511 I2I (Image-to-Image) Script
 Optimized for 32GB GPU with CPU offload
+
+Run once with --json, or keep the pipeline loaded with --watch and feed
+newline-delimited JSON jobs on stdin (same schema as the --json file).
 """
 
 import argparse
-import os
+import contextlib
 import json
-from lightx2v import LightX2VPipeline
+import os
+import sys
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+from pipe_utils import (
+    GUIDANCE_SCALE,
+    OFFLOAD_GRANULARITIES,
+    default_steps,
+    effective_negative_prompt,
+    enable_fp8,
+    get_attn_mode,
+    order_by_size,
+    prefetch_files,
+    use_fast_png,
+)
+
+
+def build_pipe(args):
+    """Initialize the pipeline with CPU offload and create the generator."""
+    # Heavy import (torch, transformers, attention kernels) deferred until needed
+    from lightx2v import LightX2VPipeline
 
-def main():
-    parser = argparse.ArgumentParser(description="Qwen Image Edit (I2I) with JSON Input")
-    parser.add_argument("--json", type=str, required=True, help="Path to JSON input file")
-    parser.add_argument("--output_dir", type=str, default=".", help="Directory to save outputs")
-    parser.add_argument("--model_path", type=str, 
-                       default="/workspace/LightX2V/models/Qwen/Qwen-Image-Edit-2511",
-                       help="Path to Qwen-Image-Edit-2511 model")
-    parser.add_argument("--steps", type=int, default=8, help="Inference steps (default: 8)")
-    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
-    
-    args = parser.parse_args()
-    
-    # Parse JSON input
-    if not os.path.exists(args.json):
-        print(f"Error: JSON file '{args.json}' not found.")
-        return
-    
-    with open(args.json, "r") as f:
-        data = json.load(f)
-    
-    # Expect array of images
-    images = data.get("images", [])
-    prompt = data.get("prompt", "")
-    negative_prompt = data.get("negative_prompt", "")
-    
-    if not images or not isinstance(images, list):
-        print("Error: JSON must contain 'images' (array of image paths)")
-        return
-    
-    if not prompt:
-        print("Error: JSON must contain 'prompt'")
-        return
-    
-    if not prompt:
-        print("Error: JSON must contain 'prompt'")
-        return
-    
-    print(f"Processing {len(images)} image(s) with prompt: '{prompt}'")
-    
-    # Initialize pipeline with CPU offload
     print("Initializing pipeline with CPU offload...")
     pipe = LightX2VPipeline(
         model_path=args.model_path,
         model_cls="qwen-image-edit-2511",
         task="i2i",
     )
-    
+
+    fp8_enabled = False
+    if args.quant_ckpt:
+        print(f"Using FP8 DiT checkpoint: {args.quant_ckpt}")
+        fp8_enabled = enable_fp8(pipe, args.quant_ckpt, force=args.force_fp8)
+
     # Enable CPU offload to fit in 32GB VRAM
+    # --keep_text_encoder skips paging the encoder back to GPU for every image
     pipe.enable_offload(
         cpu_offload=True,
-        offload_granularity="block",
-        text_encoder_offload=True,
+        offload_granularity=args.offload_granularity,
+        text_encoder_offload=not args.keep_text_encoder,
         vae_offload=False,
     )
-    
+
     # Create generator
+    # A Lightning checkpoint only implies 4 steps if it was actually loaded
+    steps = args.steps or default_steps(args.model_path, args.quant_ckpt if fp8_enabled else None)
+    print(f"Inference steps: {steps}")
+    attn_mode = get_attn_mode()
+    print(f"Using attention: {attn_mode}")
     pipe.create_generator(
-        attn_mode="torch_sdpa",  # Standard PyTorch attention
+        attn_mode=attn_mode,
         auto_resize=True,
-        infer_steps=args.steps,
-        guidance_scale=1,
+        infer_steps=steps,
+        guidance_scale=GUIDANCE_SCALE,
     )
-    
-    # Process each image
-    os.makedirs(args.output_dir, exist_ok=True)
-    
-    for idx, image_path in enumerate(images):
+
+    return pipe
+
+
+def parse_job(data):
+    """
+    Validate a job dict. Returns (images, prompt, negative_prompt),
+    or None if the job is invalid.
+    """
+    if not isinstance(data, dict):
+        print("Error: JSON job must be an object")
+        return None
+
+    # Expect array of images
+    images = data.get("images", [])
+    prompt = data.get("prompt", "")
+    negative_prompt = data.get("negative_prompt", "")
+
+    if not images or not isinstance(images, list):
+        print("Error: JSON must contain 'images' (array of image paths)")
+        return None
+
+    if not prompt:
+        print("Error: JSON must contain 'prompt'")
+        return None
+
+    return images, prompt, negative_prompt
+
+
+def run_job(pipe, images, prompt, negative_prompt, output_dir, seed):
+    """Edit every image with the same prompt. Returns the saved output paths."""
+    print(f"Processing {len(images)} image(s) with prompt: '{prompt}'")
+    negative_prompt = effective_negative_prompt(negative_prompt)
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_paths = []
+
+    # The pipeline takes one image per generate() call, so run same-sized
+    # images back to back instead of batching them
+    for idx, image_path in prefetch_files(order_by_size(images)):
         if not os.path.exists(image_path):
             print(f"Warning: Image '{image_path}' not found, skipping...")
             continue
-        
+
         # Generate output filename
         base_name = os.path.basename(image_path)
         name, ext = os.path.splitext(base_name)
-        output_path = os.path.join(args.output_dir, f"{name}_edited{ext}")
-        
+        output_path = os.path.join(output_dir, f"{name}_edited{ext}")
+
         print(f"\n[{idx+1}/{len(images)}] Processing: {image_path}")
         print(f"  Output: {output_path}")
-        
+
         # Generate
         pipe.generate(
-            seed=args.seed,
+            seed=seed,
             image_path=image_path,
             prompt=prompt,
             negative_prompt=negative_prompt,
             save_result_path=output_path,
         )
-        
+        output_paths.append(output_path)
+
         print(f"  ✅ Saved to: {output_path}")
-    
+
     print(f"\n✅ Completed! Processed {len(images)} image(s)")
+    return output_paths
+
+
+def _write_status(status_out, status):
+    status_out.write(json.dumps(status) + "\n")
+    status_out.flush()
+
+
+def edit_image_daemon(pipe, args, status_out):
+    """
+    Read newline-delimited JSON jobs from stdin and run them on an already
+    built pipeline. Each job may override 'output_dir' and 'seed'.
+    A one-line JSON status is written to status_out after every job.
+    """
+    import torch
+
+    print("Ready. Waiting for JSON jobs on stdin (one per line)...", flush=True)
+
+    with torch.inference_mode():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                data = json_loads(line)
+            except json.JSONDecodeError as e:
+                _write_status(status_out, {"status": "error", "detail": f"Invalid JSON: {e}"})
+                continue
+
+            job = parse_job(data)
+            if job is None:
+                _write_status(status_out, {"status": "error", "detail": "Invalid job"})
+                continue
+
+            images, prompt, negative_prompt = job
+            try:
+                output_paths = run_job(
+                    pipe, images, prompt, negative_prompt,
+                    output_dir=data.get("output_dir", args.output_dir),
+                    seed=data.get("seed", args.seed),
+                )
+            except Exception as e:
+                print(f"[Error] Generation failed: {str(e)}")
+                _write_status(status_out, {"status": "error", "detail": str(e)})
+                continue
+
+            _write_status(status_out, {"status": "success", "output_paths": output_paths})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qwen Image Edit (I2I) with JSON Input")
+    parser.add_argument("--json", type=str, help="Path to JSON input file")
+    parser.add_argument("--watch", action="store_true",
+                       help="Keep the pipeline loaded and read JSON jobs from stdin, one per line")
+    parser.add_argument("--output_dir", type=str, default=".", help="Directory to save outputs")
+    parser.add_argument("--model_path", type=str,
+                       default="/workspace/LightX2V/models/Qwen/Qwen-Image-Edit-2511",
+                       help="Path to Qwen-Image-Edit-2511 model")
+    parser.add_argument("--steps", type=int, default=None,
+                       help="Inference steps (default: 4 for Lightning checkpoints, else 8)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--quant_ckpt", type=str, default=None,
+                       help="FP8 DiT checkpoint (e.g. Lightning fp8_e4m3fn .safetensors) to load instead of BF16 weights")
+    parser.add_argument("--force_fp8", action="store_true",
+                       help="Use --quant_ckpt even on GPUs without native FP8 (pre-Ada)")
+    parser.add_argument("--offload_granularity", type=str, default="block", choices=OFFLOAD_GRANULARITIES,
+                       help="DiT CPU offload granularity (default: block)")
+    parser.add_argument("--keep_text_encoder", action="store_true",
+                       help="Keep the text encoder resident on GPU instead of offloading it (needs >32GB VRAM)")
+
+    args = parser.parse_args()
+
+    if args.watch:
+        # stdout carries only the JSON status lines; progress, warnings and
+        # pipeline logs go to stderr so scripts can read statuses directly
+        status_out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            use_fast_png()
+            pipe = build_pipe(args)
+            edit_image_daemon(pipe, args, status_out)
+        return
+
+    if not args.json:
+        parser.error("one of --json or --watch is required")
+
+    # Parse JSON input
+    if not os.path.exists(args.json):
+        print(f"Error: JSON file '{args.json}' not found.")
+        return
+
+    with open(args.json, "rb") as f:
+        data = json_loads(f.read())
+
+    job = parse_job(data)
+    if job is None:
+        return
+
+    images, prompt, negative_prompt = job
+    import torch
+
+    use_fast_png()
+    pipe = build_pipe(args)
+
+    with torch.inference_mode():
+        run_job(pipe, images, prompt, negative_prompt, args.output_dir, args.seed)
 
 if __name__ == "__main__":
     main()
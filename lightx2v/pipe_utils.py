@@ -0,0 +1,196 @@
+"""
+Shared helpers for the LightX2V edit scripts (edit_image.py, server.py)
+
+torch and PIL are imported inside the functions that need them, so
+importing this module (and running --help) stays fast.
+"""
+
+import functools
+import importlib.util
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Offload granularities understood by LightX2VPipeline.enable_offload().
+# Both prefetch the next unit on a separate CUDA stream; "phase" swaps
+# smaller pieces of each block (less VRAM, more transfers).
+OFFLOAD_GRANULARITIES = ("block", "phase")
+
+# CFG is a no-op at guidance 1; LightX2V then runs only the conditional pass
+GUIDANCE_SCALE = 1
+
+# Attention backends (LightX2V attn_mode names) in order of preference
+ATTN_MODES = ("sage_attn3", "sage_attn2", "flash_attn3", "flash_attn2", "torch_sdpa")
+
+
+def _has_module(name):
+    # find_spec locates the package without importing it (no Triton/CUDA init)
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def get_attn_mode():
+    """
+    Pick the fastest attention backend available on this machine.
+    Ladder: sage_attn3 (Blackwell) -> sage_attn2 -> flash_attn3 (Hopper only)
+    -> flash_attn2 -> torch_sdpa
+    Set LIGHTX2V_ATTN to one of ATTN_MODES to skip probing entirely.
+    """
+    import torch
+
+    override = os.environ.get("LIGHTX2V_ATTN")
+    if override:
+        if override not in ATTN_MODES:
+            raise ValueError(f"LIGHTX2V_ATTN must be one of {ATTN_MODES}, got '{override}'")
+        return override
+
+    major = torch.cuda.get_device_capability()[0] if torch.cuda.is_available() else 0
+
+    # SageAttention3's FP4 kernels target Blackwell (SM 10.x / 12.x)
+    if major >= 10 and _has_module("sageattn3"):
+        return "sage_attn3"
+
+    if _has_module("sageattention"):
+        return "sage_attn2"
+
+    # FA3 kernels are built for Hopper (SM 9.x) only, not Blackwell
+    if major == 9 and _has_module("flash_attn_interface"):
+        return "flash_attn3"
+
+    if _has_module("flash_attn"):
+        return "flash_attn2"
+
+    return "torch_sdpa"
+
+
+def fp8_supported():
+    """True when the GPU has native FP8 matmul (Ada SM 8.9, Hopper SM 9.0 and newer)."""
+    import torch
+
+    return torch.cuda.is_available() and torch.cuda.get_device_capability() >= (8, 9)
+
+
+def enable_fp8(pipe, quant_ckpt, force=False):
+    """
+    Load an FP8 (e.g. Lightning) DiT checkpoint via enable_quantize(). On GPUs
+    without native FP8 the kernels fall back to a slower emulated path, so the
+    base BF16 weights are kept instead unless force is set.
+    Returns True if FP8 was enabled. Call before create_generator().
+    """
+    import torch
+
+    if not force and not fp8_supported():
+        capability = torch.cuda.get_device_capability() if torch.cuda.is_available() else None
+        print(f"Warning: GPU (compute capability {capability}) has no native FP8, "
+              f"ignoring '{quant_ckpt}' and using BF16 weights (override with --force_fp8)")
+        return False
+
+    pipe.enable_quantize(
+        dit_quantized=True,
+        dit_quantized_ckpt=quant_ckpt,
+        quant_scheme="fp8-sgl",
+    )
+    return True
+
+
+def default_steps(*paths):
+    """Lightning checkpoints are distilled for 4 steps; the base model uses 8."""
+    return 4 if any(path and "Lightning" in path for path in paths) else 8
+
+
+def effective_negative_prompt(negative_prompt, guidance_scale=GUIDANCE_SCALE):
+    """Drop the negative prompt when CFG is off so it is never encoded."""
+    if guidance_scale == 1:
+        if negative_prompt:
+            print("Note: negative_prompt is ignored at guidance_scale=1")
+        return ""
+    return negative_prompt
+
+
+def use_fast_png(compress_level=1):
+    """
+    Make PIL PNG saves default to a low zlib level. generate() saves the
+    result itself, so this is the only way to speed up its encode; level 1
+    is several times faster than the default 6 for a slightly larger file.
+    """
+    from PIL import Image, PngImagePlugin
+
+    def _save(im, fp, filename):
+        im.encoderinfo.setdefault("compress_level", compress_level)
+        PngImagePlugin._save(im, fp, filename)
+
+    Image.register_save(PngImagePlugin.PngImageFile.format, _save)
+
+
+def order_by_size(image_paths):
+    """
+    Return (index, path) pairs with same-sized images next to each other, so
+    consecutive generate() calls reuse the same auto_resize shape (no
+    allocator churn). Groups keep first-seen order; unreadable paths go
+    last and are left for the caller to report.
+    """
+    from PIL import Image
+
+    groups = {}
+    for idx, path in enumerate(image_paths):
+        try:
+            # Only reads the header, not the pixel data
+            with Image.open(path) as img:
+                key = img.size
+        except (OSError, ValueError):
+            key = None
+        groups.setdefault(key, []).append((idx, path))
+
+    unreadable = groups.pop(None, [])
+    return [item for group in groups.values() for item in group] + unreadable
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as f:
+            while f.read(1 << 20):
+                pass
+    except OSError:
+        pass
+
+
+def prefetch_files(items):
+    """
+    Yield (index, path) pairs while a background thread reads the next file
+    into the OS page cache, so its load inside generate() doesn't wait on disk.
+    """
+    items = list(items)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for i, item in enumerate(items):
+            if i + 1 < len(items):
+                pool.submit(_read_file, items[i + 1][1])
+            yield item
+
+
+def warmup(pipe):
+    """
+    Run one throwaway generate() on a 64x64 black image so cuDNN/Triton
+    autotuning happens before the first real request.
+    """
+    import torch
+    from PIL import Image
+
+    torch.backends.cudnn.benchmark = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, "warmup.png")
+        Image.new("RGB", (64, 64)).save(image_path)
+        pipe.generate(
+            seed=0,
+            image_path=image_path,
+            prompt="warmup",
+            negative_prompt="",
+            save_result_path=os.path.join(tmp_dir, "warmup_edited.png"),
+        )
+
+    # Hand the first real request a clean allocator
+    torch.cuda.synchronize()
+    torch.cuda.empty_cache()
@@ -135,6 +135,10 @@ SERVER_SCRIPT_URL="https://raw.githubusercontent.com/daromaj/vast_experiments/ma
 echo "Downloading server.py to /workspace..."
 wget -O "$SCRIPTS_DIR/server.py" "$SERVER_SCRIPT_URL"
 
+# Shared helpers imported by edit_image.py and server.py
+echo "Downloading pipe_utils.py to /workspace..."
+wget -O "$SCRIPTS_DIR/pipe_utils.py" "https://raw.githubusercontent.com/daromaj/vast_experiments/master/lightx2v/pipe_utils.py"
+
 echo "Downloading example_edit_input.json..."
 wget -O "$SCRIPTS_DIR/example_edit_input.json" "https://raw.githubusercontent.com/daromaj/vast_experiments/master/lightx2v/example_edit_input.json"
 
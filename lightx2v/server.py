@@ -1,47 +1,112 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import datetime
 import time
+import uuid
 import os
-from lightx2v import LightX2VPipeline
+from concurrent.futures import ThreadPoolExecutor
+from pipe_utils import (
+    GUIDANCE_SCALE,
+    OFFLOAD_GRANULARITIES,
+    default_steps,
+    effective_negative_prompt,
+    enable_fp8,
+    get_attn_mode,
+    order_by_size,
+    prefetch_files,
+    use_fast_png,
+    warmup,
+)
 import contextlib
 
 # Global pipeline variable
 pipe = None
 
+# Jobs are (EditRequest, asyncio.Future) pairs drained by worker()
+job_queue = None
+worker_task = None
+# One thread so only one generate() touches the GPU at a time
+gpu_executor = ThreadPoolExecutor(max_workers=1)
+
+# Same-prompt requests arriving within this window share one GPU run
+BATCH_WINDOW_S = 0.02
+MAX_BATCH = 4
+
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
-    global pipe
+    global pipe, job_queue, worker_task
+    # Imported here so `uvicorn --help` and module import stay fast
+    from lightx2v import LightX2VPipeline
+
     print("[SERVER] Initializing LightX2V pipeline...")
     start_time = time.time()
+    use_fast_png()
     
+    model_path = os.environ.get("LIGHTX2V_MODEL_PATH", "/workspace/LightX2V/models/Qwen/Qwen-Image-Edit-2511")
+    quant_ckpt = os.environ.get("LIGHTX2V_QUANT_CKPT")
+
     # Initialize pipeline
     pipe = LightX2VPipeline(
-        model_path="/workspace/LightX2V/models/Qwen/Qwen-Image-Edit-2511",
+        model_path=model_path,
         model_cls="qwen-image-edit-2511",
         task="i2i",
     )
 
+    fp8_enabled = False
+    if quant_ckpt:
+        print(f"[SERVER] Using FP8 DiT checkpoint: {quant_ckpt}")
+        fp8_enabled = enable_fp8(pipe, quant_ckpt, force=os.environ.get("LIGHTX2V_FORCE_FP8") == "1")
+
     # Enable CPU offload
+    # LIGHTX2V_KEEP_TEXT_ENCODER=1 keeps the encoder on GPU (needs >32GB VRAM)
+    keep_text_encoder = os.environ.get("LIGHTX2V_KEEP_TEXT_ENCODER") == "1"
+    offload_granularity = os.environ.get("LIGHTX2V_OFFLOAD_GRANULARITY", "block")
+    if offload_granularity not in OFFLOAD_GRANULARITIES:
+        raise ValueError(f"LIGHTX2V_OFFLOAD_GRANULARITY must be one of {OFFLOAD_GRANULARITIES}")
     pipe.enable_offload(
         cpu_offload=True,
-        offload_granularity="block",
-        text_encoder_offload=True,
+        offload_granularity=offload_granularity,
+        text_encoder_offload=not keep_text_encoder,
         vae_offload=False,
     )
     
-    # Create generator with torch_sdpa (fastest supported)
+    # Lightning checkpoints are distilled for 4 steps; only count the FP8
+    # checkpoint if it was actually loaded (base BF16 weights need 8)
+    steps = int(
+        os.environ.get("LIGHTX2V_STEPS")
+        or default_steps(model_path, quant_ckpt if fp8_enabled else None)
+    )
+    print(f"[SERVER] Inference steps: {steps}")
+
+    # Create generator with the fastest available attention backend
+    attn_mode = get_attn_mode()
+    print(f"[SERVER] Using attention: {attn_mode}")
     pipe.create_generator(
-        attn_mode="torch_sdpa",
+        attn_mode=attn_mode,
         auto_resize=True,
-        infer_steps=8,
-        guidance_scale=1,
+        infer_steps=steps,
+        guidance_scale=GUIDANCE_SCALE,
     )
     
     print(f"[SERVER] Model loaded in {time.time() - start_time:.2f}s")
+
+    # LIGHTX2V_WARMUP=0 skips the warmup generation
+    if os.environ.get("LIGHTX2V_WARMUP", "1") != "0":
+        warmup_start = time.time()
+        warmup(pipe)
+        print(f"[SERVER] Warmup done in {time.time() - warmup_start:.2f}s")
+
+    job_queue = asyncio.Queue()
+    worker_task = asyncio.create_task(worker())
+
     print("[SERVER] Ready to process requests!")
     yield
     print("[SERVER] Shutting down...")
+    worker_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await worker_task
     pipe = None
 
 app = FastAPI(lifespan=lifespan)
@@ -57,33 +122,128 @@ class EditResponse(BaseModel):
     output_paths: List[str]
     generation_time: float
 
+def get_unique_filename(orig, idx, run_ts, run_id):
+    """Output path next to the input; run_ts/run_id are computed once per run, not per image."""
+    base, ext = os.path.splitext(orig)
+    return f"{base}_edited_{run_ts}_{run_id}{idx:04d}{ext}"
+
+
+def run_batch(requests):
+    """
+    Run a group of requests that share prompt/negative_prompt/seed on the GPU.
+    Blocking; called from the GPU worker thread. Returns, per request, its
+    output paths or the exception that failed it; a failing image only
+    fails its own request, the others in the batch keep going.
+    """
+    first = requests[0]
+    negative_prompt = effective_negative_prompt(first.negative_prompt)
+
+    # Flatten all images so same-sized ones across requests run back to back
+    jobs = [(req_idx, idx, img_path)
+            for req_idx, request in enumerate(requests)
+            for idx, img_path in enumerate(request.images)]
+    all_paths = [img_path for _, _, img_path in jobs]
+
+    results = [[None] * len(request.images) for request in requests]
+    run_ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # One id per request so coalesced requests never share an output name
+    run_ids = [uuid.uuid4().hex[:4] for _ in requests]
+    for job_idx, img_path in prefetch_files(order_by_size(all_paths)):
+        req_idx, idx, _ = jobs[job_idx]
+        if isinstance(results[req_idx], Exception):
+            continue
+
+        out_path = get_unique_filename(img_path, idx, run_ts, run_ids[req_idx])
+
+        print(f"  - Processing: {img_path} -> {out_path}")
+
+        try:
+            pipe.generate(
+                seed=first.seed,
+                image_path=img_path,
+                prompt=first.prompt,
+                negative_prompt=negative_prompt,
+                save_result_path=out_path,
+            )
+        except Exception as e:
+            print(f"  - Failed: {img_path}: {e}")
+            results[req_idx] = e
+            continue
+        results[req_idx][idx] = out_path
+
+    return results
+
+
+def _batch_key(request):
+    return (request.prompt, request.negative_prompt, request.seed)
+
+
+async def worker():
+    """
+    Drain job_queue and run jobs on the GPU thread. Consecutive jobs with the
+    same prompt/negative_prompt/seed queued within BATCH_WINDOW_S are
+    coalesced (up to MAX_BATCH) into one run.
+    """
+    loop = asyncio.get_running_loop()
+    pending = None
+
+    while True:
+        job = pending or await job_queue.get()
+        pending = None
+        batch = [job]
+        key = _batch_key(job[0])
+
+        deadline = loop.time() + BATCH_WINDOW_S
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                next_job = await asyncio.wait_for(job_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if _batch_key(next_job[0]) != key:
+                # Keep FIFO order: handled on the next iteration
+                pending = next_job
+                break
+            batch.append(next_job)
+
+        requests = [request for request, _ in batch]
+        if len(batch) > 1:
+            print(f"[Worker] Coalesced {len(batch)} requests with prompt: '{key[0]}'")
+
+        try:
+            results = await loop.run_in_executor(gpu_executor, run_batch, requests)
+        except Exception as e:
+            # Batch-wide failure; per-image errors come back in results instead
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
 @app.post("/edit", response_model=EditResponse)
 async def edit_image(request: EditRequest):
     if pipe is None:
         raise HTTPException(status_code=500, detail="Model not initialized")
     
     start_time = time.time()
-    output_paths = []
     
     print(f"[Request] Processing {len(request.images)} images with prompt: '{request.prompt}'")
     
+    future = asyncio.get_running_loop().create_future()
+    await job_queue.put((request, future))
+
     try:
-        for idx, img_path in enumerate(request.images):
-            # Generate output path
-            base, ext = os.path.splitext(img_path)
-            out_path = f"{base}_edited_{int(time.time())}_{idx}{ext}"
-            
-            print(f"  - Processing: {img_path} -> {out_path}")
-            
-            pipe.generate(
-                seed=request.seed,
-                image_path=img_path,
-                prompt=request.prompt,
-                negative_prompt=request.negative_prompt,
-                save_result_path=out_path,
-            )
-            output_paths.append(out_path)
-            
+        output_paths = await future
     except Exception as e:
         print(f"[Error] Generation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -14,10 +14,12 @@ Prerequisite: activate the project virtual environment first, e.g.::
     source .venv/bin/activate
 """
 import curses
+import argparse
 import subprocess
-import json
 import sys
-from typing import List, Dict, Optional
+from typing import List, Optional
+
+from vastai_core import Offer, add_search_args, cheapest_offers, search_filtered
 
 # Search criteria
 MIN_GPU_RAM = 24  # GB (minimum for Wan2.1-I2V-14B with offloading)
@@ -33,75 +35,14 @@ EXCLUDE_GPU_NAMES = []
 CONTAINER_SIZE_GB = 120  # GB (sufficient with cache cleanup)
 DATA_DOWNLOAD_GB = 100  # GB - downloaded during the 1hr rental period
 
-
-def run_vastai_search(instance_type: str) -> List[Dict]:
-    """
-    Run vastai search for given instance type (on-demand or bid).
-    Returns list of offers as dictionaries.
-    """
-    query = (
-        f"gpu_ram >= {MIN_GPU_RAM} "
-        f"disk_space >= {MIN_DISK_SPACE} "
-        f"inet_down_cost < {MAX_INET_COST} "
-        f"inet_up_cost < {MAX_INET_COST} "
-        f"inet_down >= {MIN_INET_DOWN_SPEED}"
-    )
-
-    cmd = ["vastai", "search", "offers", query, "--raw"]
-
-    # Add type flag
-    if instance_type == "bid":
-        cmd.append("-b")
-    elif instance_type == "on-demand":
-        cmd.append("-d")
-
-    print(f"Searching {instance_type} instances...", file=sys.stderr)
-
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        offers = json.loads(result.stdout)
-
-        # Filter out incompatible GPUs and add instance type
-        filtered_offers = []
-        for offer in offers:
-            gpu_name = offer.get('gpu_name', '')
-            # Skip if GPU is in exclusion list
-            if any(excluded in gpu_name for excluded in EXCLUDE_GPU_NAMES):
-                continue
-            offer['instance_type'] = instance_type
-            filtered_offers.append(offer)
-
-        return filtered_offers
-    except subprocess.CalledProcessError as e:
-        print(f"Error searching {instance_type}: {e.stderr}", file=sys.stderr)
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON for {instance_type}: {e}", file=sys.stderr)
-        return []
-
-
-def calculate_total_cost(offer: Dict) -> float:
-    """
-    Calculate estimated total cost for 1 hour rental including:
-    - Base rental cost (dph) for 1 hour
-    - Storage cost for container for 1 hour
-    - Download cost for 100GB (full one-time cost)
-    """
-    # Base rental cost per hour
-    dph = offer.get('dph_total', offer.get('dph', 0)) or 0
-
-    # Storage cost ($/GB/month converted to $/hour)
-    # storage_cost is in $/GB/month, convert to hourly
-    storage_cost_per_gb_month = offer.get('storage_cost', 0) or 0
-    storage_cost_hourly = (CONTAINER_SIZE_GB * storage_cost_per_gb_month) / (30 * 24)
-
-    # Download cost (full one-time cost for 100GB during the 1hr rental)
-    inet_down_cost = offer.get('inet_down_cost', 0) or 0
-    download_cost_total = DATA_DOWNLOAD_GB * inet_down_cost
-
-    total_cost = dph + storage_cost_hourly + download_cost_total
-
-    return total_cost
+# `vastai search offers` query built from the criteria above; also the cache key
+QUERY_STR = (
+    f"gpu_ram >= {MIN_GPU_RAM} "
+    f"disk_space >= {MIN_DISK_SPACE} "
+    f"inet_down_cost < {MAX_INET_COST} "
+    f"inet_up_cost < {MAX_INET_COST} "
+    f"inet_down >= {MIN_INET_DOWN_SPEED}"
+)
 
 
 def format_table_header() -> str:
@@ -113,19 +54,18 @@ def format_table_header() -> str:
     return header_line + divider
 
 
-def format_table_row(offer: Dict, rank: int, selected: bool = False) -> str:
+def format_table_row(offer: Offer, rank: int, selected: bool = False) -> str:
     """
     Format offer as a single table row with critical info only.
     If selected, highlight with '*' or color if possible.
     """
     prefix = '*' if selected else ' '
     # Extract critical fields
-    # Use 'id' (ask_contract_id) which is what vastai create instance needs
-    machine_id = str(offer.get('id', offer.get('ask_contract_id', 'N/A')))[:5]
-    instance_type = offer.get('instance_type', 'unk')[:3].upper()
-    gpu_name = offer.get('gpu_name', 'Unknown').replace('_', ' ')[:12]
-    num_gpus = offer.get('num_gpus', 0)
-    gpu_ram = offer.get('gpu_ram', 0)
+    machine_id = offer.disp_id[:5]
+    instance_type = offer.disp_type[:3]
+    gpu_name = offer.disp_gpu[:12]
+    num_gpus = offer.num_gpus
+    gpu_ram = offer.gpu_ram
 
     # Format VRAM in human readable way
     if gpu_ram and gpu_ram < 1000:
@@ -136,32 +76,31 @@ def format_table_row(offer: Dict, rank: int, selected: bool = False) -> str:
         vram_str = f"{num_gpus}x{int(vram_gb)}G"
 
     # Get TFLOPS (total_flops is in TFLOPS)
-    total_flops = offer.get('total_flops', 0)
-    tflops_str = f"{total_flops:.1f}" if total_flops else "N/A"
+    tflops_str = f"{offer.total_flops:.1f}" if offer.total_flops else "N/A"
 
-    total_cost = offer.get('estimated_total_cost', 0)
-    dph = offer.get('dph_total', offer.get('dph', 0)) or 0
+    total_cost = offer.estimated_total_cost
+    dph = offer.dph
 
-    inet_down = offer.get('inet_down', 0)
-    inet_up = offer.get('inet_up', 0)
+    inet_down = offer.inet_down
+    inet_up = offer.inet_up
     # Convert Mb/s to Gb/s for cleaner display
     down_str = f"{inet_down/1000:.1f}Gb" if inet_down >= 1000 else f"{int(inet_down)}Mb"
     up_str = f"{inet_up/1000:.1f}Gb" if inet_up >= 1000 else f"{int(inet_up)}Mb"
 
-    geolocation = offer.get('geolocation', 'N/A')[:2]
-    reliability = offer.get('reliability', 0) * 100
+    geolocation = offer.disp_geo[:2]
+    reliability = offer.reliability * 100
 
     row = f"{prefix}{rank:<1} {machine_id:<4} {instance_type:<4} {gpu_name:<12} {vram_str:<5} {total_cost:<5.4f} {dph:<5.4f} {down_str:<5} {up_str:<4} {geolocation:<2} {reliability:<3.1f} {tflops_str:<4}\n"
 
     return row
 
 
-def create_bid_instance(offer: Dict):
+def create_bid_instance(offer: Offer):
     """
     Create a bid instance for the selected offer.
     """
-    machine_id = offer['id']
-    dph = offer.get('dph_total', offer.get('dph', 0)) or 0
+    machine_id = offer.id
+    dph = offer.dph
     # Add 0.01 to bid price as suggested
     bid_price = dph + 0.01
 
@@ -177,91 +116,126 @@ def create_bid_instance(offer: Dict):
         return False
 
 
-def curses_interactive_select(offers: List[Dict]) -> Optional[int]:
+def curses_interactive_select(offers: List[Offer]) -> Optional[int]:
     """
     Use curses to display interactive menu for selecting an offer.
     Returns the index of the selected offer, or None if quit.
     """
 
-    def _draw_menu(stdscr, offers, selected_row_idx):
+    # Screen layout: title, divider, 2 header lines, then one line per offer
+    first_row_y = 4
+
+    def _title(selected_row_idx):
+        return f"TOP {len(offers)} OFFERS (sorted by estimated total hourly cost) - Selected: #{selected_row_idx+1}"
+
+    # Static text and rows are built once per session; only the title
+    # changes per frame and redraws only move the highlight
+    rows = [format_table_row(offer, idx+1).rstrip('\n') for idx, offer in enumerate(offers)]
+    header_lines = [line for line in format_table_header().split('\n') if line.strip()]
+    divider = "=" * len(header_lines[0])
+    footer_lines = [
+        divider,
+        "",
+        f"Est$/h = Base rental (1hr) + Storage ({CONTAINER_SIZE_GB}GB for 1hr) + Download cost ({DATA_DOWNLOAD_GB}GB one-time)",
+        "",
+        "WARNING: For BID instances, MUST use --bid_price when creating instance!",
+        "   Example: vastai create instance <ID> --disk 120 --bid_price <DPH+0.01>",
+        "",
+        "Filtered out: RTX 5090 (not compatible with PyTorch 2.4.1)",
+        "",
+        "TIP: 120GB is enough if you clean up caches after downloads (see plan step 2.9.2)",
+        "",
+        "Use UP/DOWN arrows to navigate, ENTER to bid, Q to quit",
+    ]
+
+    def _draw_full(stdscr, offers, selected_row_idx):
         stdscr.clear()
 
         # Init color pair for highlighting
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)  # Highlight selected row
 
-        # Get table width
-        header_line_example = "# ID   Type GPU          VRAM Est$ Base$ Down Up Loc Rel TF\n"
-        header_width = len(header_line_example.rstrip())
-
-        # Prepare lines
-        lines = [f"TOP {len(offers)} OFFERS (sorted by estimated total hourly cost) - Selected: #{selected_row_idx+1}"]
-        lines.append("=" * header_width)
-
-        # Header
-        header_lines = format_table_header().split('\n')
-        for line in header_lines:
-            if line.strip():
-                lines.append(line)
-
-        # Rows
-        for idx, offer in enumerate(offers):
-            row = format_table_row(offer, idx+1).rstrip('\n')
-            lines.append(row)
-
-        lines.append("=" * header_width)
-        lines.append("")
-        lines.append(f"Est$/h = Base rental (1hr) + Storage ({CONTAINER_SIZE_GB}GB for 1hr) + Download cost ({DATA_DOWNLOAD_GB}GB one-time)")
-        lines.append("")
-        lines.append("WARNING: For BID instances, MUST use --bid_price when creating instance!")
-        lines.append("   Example: vastai create instance <ID> --disk 120 --bid_price <DPH+0.01>")
-        lines.append("")
-        lines.append("Filtered out: RTX 5090 (not compatible with PyTorch 2.4.1)")
-        lines.append("")
-        lines.append("TIP: 120GB is enough if you clean up caches after downloads (see plan step 2.9.2)")
-        lines.append("")
-        lines.append("Use UP/DOWN arrows to navigate, ENTER to bid, Q to quit")
-
-        # Draw lines
+        lines = [_title(selected_row_idx), divider]
+        lines.extend(header_lines)
+        lines.extend(rows)
+        lines.extend(footer_lines)
+
+        # Draw lines; addnstr truncates to the screen width in ncurses
         max_y, max_x = stdscr.getmaxyx()
+        width = max_x - 1
         for i, line in enumerate(lines):
             if i < max_y:
-                truncated = line[:max_x-1]
                 try:
                     if i >= len(lines) - 10:  # Instructions at bottom
-                        stdscr.addstr(i, 0, truncated)
+                        stdscr.addnstr(i, 0, line, width)
                     else:
-                        row_idx = i - len(lines) + 10  # Calculate actual row index for offers
-                        if i >= 4 and i < 4 + len(offers):
-                            row_idx = i - 4
+                        if i >= first_row_y and i < first_row_y + len(offers):
+                            row_idx = i - first_row_y
                             if row_idx == selected_row_idx:
                                 stdscr.attron(curses.color_pair(1))
-                                stdscr.addstr(i, 0, truncated)
+                                stdscr.addnstr(i, 0, line, width)
                                 stdscr.attroff(curses.color_pair(1))
                             else:
-                                stdscr.addstr(i, 0, truncated)
+                                stdscr.addnstr(i, 0, line, width)
                         else:
-                            stdscr.addstr(i, 0, truncated)
+                            stdscr.addnstr(i, 0, line, width)
                 except curses.error:
                     pass
 
         stdscr.refresh()
 
+    def _repaint_line(stdscr, screen_y, line, highlighted=False):
+        max_y, max_x = stdscr.getmaxyx()
+        if screen_y >= max_y:
+            return
+        try:
+            stdscr.move(screen_y, 0)
+            stdscr.clrtoeol()
+            if highlighted:
+                stdscr.attron(curses.color_pair(1))
+            stdscr.addnstr(screen_y, 0, line, max_x - 1)
+        except curses.error:
+            pass
+        finally:
+            if highlighted:
+                stdscr.attroff(curses.color_pair(1))
+
+    def _repaint_row(stdscr, row_idx, selected):
+        _repaint_line(stdscr, first_row_y + row_idx, rows[row_idx], highlighted=selected)
+
     def _select_loop(stdscr, offers):
         curses.curs_set(0)
+        stdscr.keypad(True)
         current_row = 0
-        _draw_menu(stdscr, offers, current_row)
+        _draw_full(stdscr, offers, current_row)
         while True:
             key = stdscr.getch()
-            if key == curses.KEY_UP and current_row > 0:
-                current_row -= 1
-            elif key == curses.KEY_DOWN and current_row < len(offers) - 1:
-                current_row += 1
+            if key == curses.KEY_UP:
+                new_row = max(current_row - 1, 0)
+            elif key == curses.KEY_DOWN:
+                new_row = min(current_row + 1, len(offers) - 1)
             elif key in [10, 13, curses.KEY_ENTER]:
                 break
             elif key in [ord('q'), ord('Q')]:
                 return None
-            _draw_menu(stdscr, offers, current_row)
+            elif key == curses.KEY_RESIZE:
+                _draw_full(stdscr, offers, current_row)
+                continue
+            else:
+                # Stray keys and mouse events leave the screen untouched
+                continue
+
+            # Nothing to repaint when already at the top/bottom row
+            if new_row == current_row:
+                continue
+
+            # Only the title and the two rows whose highlight changed are repainted
+            _repaint_row(stdscr, current_row, False)
+            _repaint_row(stdscr, new_row, True)
+            _repaint_line(stdscr, 0, _title(new_row))
+            stdscr.noutrefresh()
+            curses.doupdate()
+            current_row = new_row
         return current_row
 
     return curses.wrapper(_select_loop, offers)
@@ -271,11 +245,16 @@ def main():
     """
     Main function to search, combine, calculate, display, and allow interactive selection.
     """
+    parser = argparse.ArgumentParser(description="Interactively pick and bid on vast.ai offers")
+    add_search_args(parser)
+    args = parser.parse_args()
+
     print("Starting vast.ai search...\n", file=sys.stderr)
 
     # Search both types
-    on_demand_offers = run_vastai_search("on-demand")
-    bid_offers = run_vastai_search("bid")
+    on_demand_offers, bid_offers = search_filtered(
+        QUERY_STR, EXCLUDE_GPU_NAMES, use_cache=not args.refresh, merged=args.merged
+    )
 
     # Combine results
     all_offers = on_demand_offers + bid_offers
@@ -286,15 +265,8 @@ def main():
 
     print(f"\nFound {len(all_offers)} total offers ({len(on_demand_offers)} on-demand, {len(bid_offers)} interruptible)\n", file=sys.stderr)
 
-    # Calculate total cost for each offer
-    for offer in all_offers:
-        offer['estimated_total_cost'] = calculate_total_cost(offer)
-
-    # Sort by estimated total cost
-    all_offers.sort(key=lambda x: x['estimated_total_cost'])
-
-    # Display top 15 (or fewer if less available)
-    top_offers = all_offers[:15]
+    # Display the 15 cheapest (or fewer if less available)
+    top_offers = cheapest_offers(all_offers, 15, CONTAINER_SIZE_GB, DATA_DOWNLOAD_GB)
 
     if not top_offers:
         return
@@ -309,7 +281,7 @@ def main():
 
     # Bid on selected
     selected_offer = top_offers[selected_idx]
-    print(f"Selected instance: ID {selected_offer['id']}")
+    print(f"Selected instance: ID {selected_offer.id}")
     confirm = input("Are you sure you want to bid on this instance? (y/n): ").strip().lower()
     if confirm == 'y':
         create_bid_instance(selected_offer)
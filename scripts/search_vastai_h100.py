@@ -13,10 +13,17 @@ H100/H200 accelerators, calculates an estimated hourly cost (base rental,
 storage, and download amortization), and prints a ranked summary table.
 """
 
-import json
-import subprocess
+import argparse
+import io
 import sys
-from typing import Dict, List
+
+from vastai_core import (
+    add_search_args,
+    cheapest_offers,
+    format_table_header,
+    format_table_row,
+    search_filtered,
+)
 
 # Search criteria tuned for H100/H200 workloads
 MIN_GPU_RAM = 80  # GB
@@ -32,114 +39,26 @@ EXCLUDE_GPU_NAMES = ["RTX 5090", "RTX_5090"]
 CONTAINER_SIZE_GB = 160
 DATA_DOWNLOAD_GB = 150
 
-
-def gpu_matches_target(gpu_name: str) -> bool:
-    """Return True when the GPU name references either H100 or H200."""
-    normalized = (gpu_name or "").upper()
-    return any(keyword in normalized for keyword in TARGET_GPU_KEYWORDS)
-
-
-def run_vastai_search(instance_type: str) -> List[Dict]:
-    """Invoke `vastai search offers` for the requested instance type."""
-    query = (
-        f"gpu_ram >= {MIN_GPU_RAM} "
-        f"disk_space >= {MIN_DISK_SPACE} "
-        f"inet_down_cost < {MAX_INET_COST} "
-        f"inet_up_cost < {MAX_INET_COST} "
-        f"inet_down >= {MIN_INET_DOWN_SPEED}"
-    )
-
-    cmd = ["vastai", "search", "offers", query, "--raw"]
-
-    if instance_type == "bid":
-        cmd.append("-b")
-    elif instance_type == "on-demand":
-        cmd.append("-d")
-
-    print(f"Searching {instance_type} instances...", file=sys.stderr)
-
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        offers = json.loads(result.stdout)
-
-        filtered_offers = []
-        for offer in offers:
-            gpu_name = offer.get("gpu_name", "")
-            if any(excluded in gpu_name for excluded in EXCLUDE_GPU_NAMES):
-                continue
-            if not gpu_matches_target(gpu_name):
-                continue
-            offer["instance_type"] = instance_type
-            filtered_offers.append(offer)
-
-        return filtered_offers
-    except subprocess.CalledProcessError as exc:
-        print(f"Error searching {instance_type}: {exc.stderr}", file=sys.stderr)
-        return []
-    except json.JSONDecodeError as exc:
-        print(f"Error parsing JSON for {instance_type}: {exc}", file=sys.stderr)
-        return []
-
-
-def calculate_total_cost(offer: Dict) -> float:
-    """Compute estimated hourly cost including storage and download amortization."""
-    dph = offer.get("dph_total", offer.get("dph", 0)) or 0
-    storage_cost_per_gb_month = offer.get("storage_cost", 0) or 0
-    storage_cost_hourly = (CONTAINER_SIZE_GB * storage_cost_per_gb_month) / (30 * 24)
-    inet_down_cost = offer.get("inet_down_cost", 0) or 0
-    download_cost_total = DATA_DOWNLOAD_GB * inet_down_cost
-    return dph + storage_cost_hourly + download_cost_total
-
-
-def format_table_header() -> str:
-    header = (
-        f"{'#':<4} {'ID':<8} {'Type':<6} {'GPU':<20} {'VRAM':<8} "
-        f"{'Est$/h':<8} {'Base$/h':<8} {'Down':<8} {'Up':<8} {'Loc':<4} "
-        f"{'Rel%':<5} {'TFLOPS':<8}\n"
-    )
-    header += "-" * 130 + "\n"
-    return header
-
-
-def format_table_row(offer: Dict, rank: int) -> str:
-    machine_id = str(offer.get("id", offer.get("ask_contract_id", "N/A")))[:8]
-    instance_type = offer.get("instance_type", "unk")[:6].upper()
-    gpu_name = offer.get("gpu_name", "Unknown").replace("_", " ")[:20]
-    num_gpus = offer.get("num_gpus", 0)
-    gpu_ram = offer.get("gpu_ram", 0)
-
-    if gpu_ram and gpu_ram < 1000:
-        vram_str = f"{num_gpus}x{int(gpu_ram)}G"
-    else:
-        vram_gb = gpu_ram / 1024 if gpu_ram > 1000 else gpu_ram
-        vram_str = f"{num_gpus}x{int(vram_gb)}G"
-
-    total_flops = offer.get("total_flops", 0)
-    tflops_str = f"{total_flops:.1f}" if total_flops else "N/A"
-
-    total_cost = offer.get("estimated_total_cost", 0)
-    dph = offer.get("dph_total", offer.get("dph", 0)) or 0
-
-    inet_down = offer.get("inet_down", 0)
-    inet_up = offer.get("inet_up", 0)
-    down_str = f"{inet_down/1000:.1f}Gb/s" if inet_down >= 1000 else f"{int(inet_down)}Mb/s"
-    up_str = f"{inet_up/1000:.1f}Gb/s" if inet_up >= 1000 else f"{int(inet_up)}Mb/s"
-
-    geolocation = offer.get("geolocation", "N/A")[:4]
-    reliability = offer.get("reliability", 0) * 100
-
-    return (
-        f"{rank:<4} {machine_id:<8} {instance_type:<6} {gpu_name:<20} {vram_str:<8} "
-        f"${total_cost:<7.4f} ${dph:<7.4f} {down_str:<8} {up_str:<8} {geolocation:<4} "
-        f"{reliability:>4.1f} {tflops_str:<8}\n"
-    )
+# `vastai search offers` query built from the criteria above; also the cache key
+QUERY_STR = (
+    f"gpu_ram >= {MIN_GPU_RAM} "
+    f"disk_space >= {MIN_DISK_SPACE} "
+    f"inet_down_cost < {MAX_INET_COST} "
+    f"inet_up_cost < {MAX_INET_COST} "
+    f"inet_down >= {MIN_INET_DOWN_SPEED}"
+)
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Search vast.ai H100/H200 offers and print the cheapest ones")
+    add_search_args(parser)
+    args = parser.parse_args()
+
     print("Starting vast.ai search for H100/H200 instances...\n", file=sys.stderr)
 
-    on_demand_offers = run_vastai_search("on-demand")
-    bid_offers = run_vastai_search("bid")
+    on_demand_offers, bid_offers = search_filtered(
+        QUERY_STR, EXCLUDE_GPU_NAMES, TARGET_GPU_KEYWORDS, use_cache=not args.refresh, merged=args.merged
+    )
     all_offers = on_demand_offers + bid_offers
 
     if not all_offers:
@@ -152,22 +71,20 @@ def main() -> None:
         file=sys.stderr,
     )
 
-    for offer in all_offers:
-        offer["estimated_total_cost"] = calculate_total_cost(offer)
-
-    all_offers.sort(key=lambda offer: offer["estimated_total_cost"])
-
-    top_30 = all_offers[:30]
-
-    print("\n" + "=" * 130)
-    print("TOP 30 H100/H200 OFFERS (sorted by estimated total hourly cost)")
-    print("=" * 130)
-    print(format_table_header(), end="")
+    top_30 = cheapest_offers(all_offers, 30, CONTAINER_SIZE_GB, DATA_DOWNLOAD_GB)
 
+    # Assemble the table and write it in one go
+    buf = io.StringIO()
+    buf.write("\n" + "=" * 130 + "\n")
+    buf.write("TOP 30 H100/H200 OFFERS (sorted by estimated total hourly cost)\n")
+    buf.write("=" * 130 + "\n")
+    buf.write(format_table_header())
     for idx, offer in enumerate(top_30, 1):
-        print(format_table_row(offer, idx), end="")
+        buf.write(format_table_row(offer, idx))
+    buf.write("=" * 130 + "\n")
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()
 
-    print("=" * 130)
     print(f"\nShowing top 30 of {len(all_offers)} total matching offers")
     print(
         f"Est$/h = Base rental (1hr) + Storage ({CONTAINER_SIZE_GB}GB for 1hr) + "
@@ -0,0 +1,65 @@
+"""
+Short-lived on-disk cache for `vastai search offers` results, shared by the
+search scripts so re-running one within a minute skips the API round trip.
+
+Entries are the raw offers that passed the caller's GPU filter, keyed by
+instance type, query string and a filter key describing that filter. The
+TTL defaults to 60s and can be changed with VASTAI_CACHE_TTL (seconds, 0
+disables reads).
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# orjson parses bytes (pipe output, cache files) directly; vastai_core
+# imports json_loads from here (orjson.JSONDecodeError subclasses
+# json.JSONDecodeError)
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+CACHE_DIR = os.path.expanduser("~/.cache/vastai_search")
+DEFAULT_TTL = 60  # seconds
+
+
+def cache_ttl() -> float:
+    """Return the cache TTL in seconds from VASTAI_CACHE_TTL (default 60)."""
+    try:
+        return float(os.environ.get("VASTAI_CACHE_TTL", DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def _cache_path(instance_type: str, query: str, filter_key: str) -> str:
+    key = hashlib.sha1("\0".join((instance_type, query, filter_key)).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def load(instance_type: str, query: str, filter_key: str = "") -> Optional[List[Dict]]:
+    """Return cached offers if a fresh entry exists, else None."""
+    path = _cache_path(instance_type, query, filter_key)
+    try:
+        if time.time() - os.path.getmtime(path) >= cache_ttl():
+            return None
+        with open(path, "rb") as f:
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def store(instance_type: str, query: str, offers: List[Dict], filter_key: str = "") -> None:
+    """Write offers to the cache atomically (readers never see a partial file)."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(offers, f)
+        os.replace(tmp_path, _cache_path(instance_type, query, filter_key))
+    except OSError as exc:
+        print(f"Warning: could not write search cache: {exc}", file=sys.stderr)
@@ -0,0 +1,415 @@
+"""
+Search, cost and table helpers shared by the vast.ai search scripts
+(search_vastai.py, search_vastai_h100.py, interactive_search_vastai.py).
+
+The scripts keep their own search criteria, cost parameters and GPU
+filters and pass them in. GPU filters run while the search output is
+parsed; the surviving offers are memoized per (instance type, query,
+filter) within a process on top of the on-disk cache in vastai_cache.
+"""
+import argparse
+import functools
+import heapq
+import json
+import re
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import IO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # cheapest_offers() falls back to heapq
+    np = None
+
+import vastai_cache
+from vastai_cache import json_loads
+
+try:
+    import ijson
+    JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError)
+except ImportError:  # _iter_offers() parses the whole output at once
+    ijson = None
+    JSON_ERRORS = (json.JSONDecodeError,)
+
+# orjson on the whole output beats streaming; ijson is used only without it
+_STREAM_PARSE = ijson is not None and json_loads is json.loads
+
+
+@dataclass(slots=True)
+class Offer:
+    """
+    An offer normalized once after filtering: missing/None fields are
+    coerced to the same defaults the cost and table code used to apply on
+    every access.
+    """
+    id: Optional[int]
+    instance_type: str
+    gpu_name: str
+    num_gpus: int
+    gpu_ram: float
+    dph: float
+    storage_cost: float
+    inet_down_cost: float
+    inet_down: float
+    inet_up: float
+    geolocation: str
+    reliability: float
+    total_flops: float
+    # Display strings truncated to the full-width table columns; the compact
+    # interactive table slices them further
+    disp_id: str
+    disp_type: str
+    disp_gpu: str
+    disp_geo: str
+    estimated_total_cost: float = 0.0
+
+    @classmethod
+    def from_raw(cls, raw: Dict, instance_type: str) -> "Offer":
+        """Build an Offer from a raw vastai offer dict."""
+        # 'id' (ask_contract_id) is what vastai create instance needs
+        machine_id = raw.get("id", raw.get("ask_contract_id"))
+        gpu_name = raw.get("gpu_name") or "Unknown"
+        geolocation = raw.get("geolocation") or "N/A"
+        return cls(
+            id=machine_id,
+            instance_type=instance_type,
+            gpu_name=gpu_name,
+            num_gpus=int(raw.get("num_gpus") or 0),
+            gpu_ram=float(raw.get("gpu_ram") or 0),
+            dph=float(raw.get("dph_total", raw.get("dph", 0)) or 0),
+            storage_cost=float(raw.get("storage_cost") or 0),
+            inet_down_cost=float(raw.get("inet_down_cost") or 0),
+            inet_down=float(raw.get("inet_down") or 0),
+            inet_up=float(raw.get("inet_up") or 0),
+            geolocation=geolocation,
+            reliability=float(raw.get("reliability") or 0),
+            total_flops=float(raw.get("total_flops") or 0),
+            disp_id=str(machine_id if machine_id is not None else "N/A")[:8],
+            disp_type=instance_type[:6].upper(),
+            disp_gpu=gpu_name.replace("_", " ")[:20],
+            disp_geo=geolocation[:4],
+        )
+
+
+@dataclass(frozen=True)
+class GpuFilter:
+    """
+    GPU name filter applied while search results are parsed: names
+    containing any of exclude (case-sensitive) are dropped and, when include
+    is non-empty, only names containing one of include (case-insensitive)
+    are kept. Hashable, so it keys the in-process memo and the disk cache.
+    """
+    exclude: Tuple[str, ...] = ()
+    include: Tuple[str, ...] = ()
+
+    def cache_key(self) -> str:
+        return f"exclude={list(self.exclude)} include={list(self.include)}"
+
+
+@functools.lru_cache(maxsize=None)
+def _gpu_name_check(gpu_filter: GpuFilter) -> Callable[[str], bool]:
+    """Return a predicate for gpu_filter, memoized per distinct GPU name."""
+    # One pattern scan per name instead of a substring test per keyword
+    exclude_re = re.compile("|".join(map(re.escape, gpu_filter.exclude))) if gpu_filter.exclude else None
+    include_re = (
+        re.compile("|".join(map(re.escape, gpu_filter.include)), re.IGNORECASE) if gpu_filter.include else None
+    )
+    # gpu_name -> kept; there are only a few dozen distinct GPU names, so
+    # the table saturates after a handful of offers
+    kept: Dict[str, bool] = {}
+
+    def check(gpu_name: str) -> bool:
+        hit = kept.get(gpu_name)
+        if hit is None:
+            hit = kept[gpu_name] = (
+                (exclude_re is None or exclude_re.search(gpu_name) is None)
+                and (include_re is None or include_re.search(gpu_name) is not None)
+            )
+        return hit
+
+    return check
+
+
+def _spawn(instance_type: str, query: str) -> Tuple[subprocess.Popen, IO[bytes]]:
+    """
+    Start `vastai search offers` for the given instance type without waiting
+    for it. Returns the process and the temporary file receiving its stderr.
+    """
+    cmd = ["vastai", "search", "offers", query, "--raw"]
+
+    if instance_type == "bid":
+        cmd.append("-b")
+    elif instance_type == "on-demand":
+        cmd.append("-d")
+
+    print(f"Searching {instance_type} instances...", file=sys.stderr)
+
+    # stdout is a binary pipe read while vastai writes; stderr goes to a file
+    # so it can never fill up and block vastai while stdout is being parsed
+    stderr = tempfile.TemporaryFile()
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr), stderr
+
+
+def _iter_offers(stream: IO[bytes]) -> Iterator[Dict]:
+    """
+    Yield offers from the vastai JSON array. With orjson the whole output is
+    parsed in one native call; otherwise, with ijson, offers are parsed
+    straight from the pipe one at a time; else json.loads is used.
+    """
+    if _STREAM_PARSE:
+        # use_float: floats rather than Decimals for the cost maths and cache
+        yield from ijson.items(stream, "item", use_float=True)
+    else:
+        yield from json_loads(stream.read())
+
+
+def _collect(
+    spawned: Tuple[subprocess.Popen, IO[bytes]], instance_type: str, query: str, gpu_filter: GpuFilter
+) -> List[Dict]:
+    """
+    Wait for a search started by _spawn and return the raw offers that pass
+    gpu_filter ([] on error). The filter runs as offers are parsed, so
+    rejected offers are dropped straight away and only survivors are cached.
+    """
+    proc, stderr = spawned
+    check = _gpu_name_check(gpu_filter)
+    offers = []
+    parse_error = None
+    with stderr:
+        try:
+            for offer in _iter_offers(proc.stdout):
+                if check(offer.get("gpu_name") or ""):
+                    offers.append(offer)
+        except JSON_ERRORS as e:
+            parse_error = e
+
+        # Stop reading (e.g. after a parse error) and reap the process
+        proc.stdout.close()
+        proc.wait()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            print(f"Error searching {instance_type}: {stderr.read().decode(errors='replace')}", file=sys.stderr)
+            return []
+    if parse_error is not None:
+        print(f"Error parsing JSON for {instance_type}: {parse_error}", file=sys.stderr)
+        return []
+
+    vastai_cache.store(instance_type, query, offers, gpu_filter.cache_key())
+    return offers
+
+
+# (instance_type, query, gpu_filter, use_cache) -> offers already fetched by this process
+_search_memo: Dict[Tuple[str, str, GpuFilter, bool], List[Dict]] = {}
+
+
+def _search(
+    instance_types: Sequence[str], query: str, gpu_filter: GpuFilter, use_cache: bool = True
+) -> Dict[str, List[Dict]]:
+    """
+    Return {instance_type: raw offers passing gpu_filter} for query. Each
+    type is served from this process's memo, then from the disk cache when
+    fresh; the remaining searches are all started before waiting so their
+    round trips overlap.
+    """
+    results = {}
+    spawned = {}
+    for instance_type in instance_types:
+        key = (instance_type, query, gpu_filter, use_cache)
+        if key in _search_memo:
+            results[instance_type] = _search_memo[key]
+            continue
+        cached = vastai_cache.load(instance_type, query, gpu_filter.cache_key()) if use_cache else None
+        if cached is not None:
+            print(f"Using cached {instance_type} results...", file=sys.stderr)
+            results[instance_type] = _search_memo[key] = cached
+        else:
+            spawned[instance_type] = _spawn(instance_type, query)
+
+    for instance_type, search in spawned.items():
+        offers = _collect(search, instance_type, query, gpu_filter)
+        results[instance_type] = _search_memo[(instance_type, query, gpu_filter, use_cache)] = offers
+
+    return results
+
+
+def run_vastai_search(
+    instance_type: str, query: str, use_cache: bool = True, gpu_filter: GpuFilter = GpuFilter()
+) -> List[Dict]:
+    """
+    Return the raw offers for instance_type ("on-demand" or "bid") and query
+    that pass gpu_filter, from the disk cache when fresh. Results are memoized
+    for the process, so treat the returned offers as read-only.
+    """
+    return _search((instance_type,), query, gpu_filter, use_cache)[instance_type]
+
+
+def _derive_bid_offers(on_demand_offers: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Build the interruptible view of on-demand offers by pricing each one at
+    its min_bid, so a single vastai call covers both instance types.
+    Returns None if any offer lacks a usable min_bid (caller must search bids).
+
+    Experimental: not yet checked against real `search offers -b` output.
+    Offers listed only on the interruptible market are missing, and min_bid
+    replaces the all-in dph_total that a bid search reports.
+    """
+    bid_offers = []
+    for offer in on_demand_offers:
+        min_bid = offer.get("min_bid")
+        if not isinstance(min_bid, (int, float)) or min_bid <= 0:
+            return None
+        bid_offers.append(dict(offer, dph_total=min_bid, instance_type="bid"))
+    return bid_offers
+
+
+def _search_both(query: str, gpu_filter: GpuFilter, use_cache: bool = True) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Search on-demand offers once and derive bid offers from them.
+    Falls back to a separate bid search when min_bid can't be trusted.
+    """
+    on_demand_offers = run_vastai_search("on-demand", query, use_cache, gpu_filter)
+    bid_offers = _derive_bid_offers(on_demand_offers)
+    if bid_offers is None:
+        print("Offers without min_bid, searching bid instances separately...", file=sys.stderr)
+        bid_offers = run_vastai_search("bid", query, use_cache, gpu_filter)
+    return on_demand_offers, bid_offers
+
+
+def search_all(
+    query: str, use_cache: bool = True, merged: bool = False, gpu_filter: GpuFilter = GpuFilter()
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Return raw (on_demand_offers, bid_offers) for query that pass gpu_filter.
+    Both types are searched separately: fresh cache entries are served from
+    disk and the remaining searches run concurrently. With merged, one vastai
+    call is made and bid prices come from min_bid instead (see _search_both).
+    """
+    if merged:
+        return _search_both(query, gpu_filter, use_cache)
+
+    results = _search(("on-demand", "bid"), query, gpu_filter, use_cache)
+    return results["on-demand"], results["bid"]
+
+
+def search_filtered(
+    query: str,
+    exclude_gpu_names: Sequence[str] = (),
+    include_gpu_names: Sequence[str] = (),
+    use_cache: bool = True,
+    merged: bool = False,
+) -> Tuple[List[Offer], List[Offer]]:
+    """
+    Return (on_demand, bid) Offers for query (see search_all for
+    use_cache/merged), without GPUs whose name contains one of
+    exclude_gpu_names and, if include_gpu_names is given, only GPUs whose
+    name contains one of them (case-insensitive).
+    """
+    gpu_filter = GpuFilter(tuple(exclude_gpu_names), tuple(include_gpu_names))
+    on_demand_offers, bid_offers = search_all(query, use_cache, merged, gpu_filter)
+    return (
+        [Offer.from_raw(offer, "on-demand") for offer in on_demand_offers],
+        [Offer.from_raw(offer, "bid") for offer in bid_offers],
+    )
+
+
+def add_search_args(parser: argparse.ArgumentParser) -> None:
+    """Add the --refresh/--no-cache and --merged options used by search_filtered."""
+    parser.add_argument("--refresh", "--no-cache", dest="refresh", action="store_true",
+                        help="Ignore cached search results and query vast.ai again")
+    parser.add_argument("--merged", action="store_true",
+                        help="Experimental: one search, bid prices derived from min_bid "
+                             "(unverified; may miss bid-only offers)")
+
+
+def calculate_total_cost(offer: Offer, container_size_gb: float, data_download_gb: float) -> float:
+    """
+    Calculate estimated total cost for 1 hour rental including:
+    - Base rental cost (dph) for 1 hour
+    - Storage cost for container_size_gb for 1 hour (storage_cost is $/GB/month)
+    - Download cost for data_download_gb (full one-time cost)
+    """
+    storage_cost_hourly = (container_size_gb * offer.storage_cost) / (30 * 24)
+    download_cost_total = data_download_gb * offer.inet_down_cost
+    return offer.dph + storage_cost_hourly + download_cost_total
+
+
+def cheapest_offers(offers: List[Offer], k: int, container_size_gb: float, data_download_gb: float) -> List[Offer]:
+    """
+    Return the k cheapest offers by estimated total cost, cheapest first,
+    with estimated_total_cost set on each. With NumPy the cost of every
+    offer is computed in one vectorized pass and only the top k are sorted;
+    without it falls back to calculate_total_cost() + heapq.
+    """
+    if np is None:
+        for offer in offers:
+            offer.estimated_total_cost = calculate_total_cost(offer, container_size_gb, data_download_gb)
+        return heapq.nsmallest(k, offers, key=lambda x: x.estimated_total_cost)
+
+    n = len(offers)
+    dph = np.fromiter((o.dph for o in offers), dtype=np.float64, count=n)
+    storage_cost = np.fromiter((o.storage_cost for o in offers), dtype=np.float64, count=n)
+    inet_down_cost = np.fromiter((o.inet_down_cost for o in offers), dtype=np.float64, count=n)
+    # Same operation order as calculate_total_cost() so both paths agree bit for bit
+    total = dph + (container_size_gb * storage_cost) / (30 * 24) + data_download_gb * inet_down_cost
+
+    if n > k:
+        # argpartition picks arbitrary members of a tie at the cut-off; keep
+        # everything below the k-th cost plus the earliest offers equal to it,
+        # as sorted()[:k] would
+        kth = np.partition(total, k - 1)[k - 1]
+        below = np.flatnonzero(total < kth)
+        ties = np.flatnonzero(total == kth)[: k - below.size]
+        idx = np.sort(np.concatenate((below, ties)))
+    else:
+        idx = np.arange(n)
+    # Stable on the original order so ties rank the same as a sort would
+    idx = idx[np.argsort(total[idx], kind="stable")]
+
+    top = [offers[i] for i in idx]
+    for offer, cost in zip(top, total[idx].tolist()):
+        offer.estimated_total_cost = cost
+    return top
+
+
+def format_table_header() -> str:
+    """Header for the full-width (130 column) results table."""
+    header = (
+        f"{'#':<4} {'ID':<8} {'Type':<6} {'GPU':<20} {'VRAM':<8} "
+        f"{'Est$/h':<8} {'Base$/h':<8} {'Down':<8} {'Up':<8} {'Loc':<4} "
+        f"{'Rel%':<5} {'TFLOPS':<8}\n"
+    )
+    header += "-" * 130 + "\n"
+    return header
+
+
+def format_table_row(offer: Offer, rank: int) -> str:
+    """Format an offer as one row of the full-width results table."""
+    num_gpus = offer.num_gpus
+    gpu_ram = offer.gpu_ram
+
+    # Format VRAM in human readable way
+    if gpu_ram and gpu_ram < 1000:
+        vram_str = f"{num_gpus}x{int(gpu_ram)}G"
+    else:
+        # Fix the ridiculous VRAM values (appears to be in MB not GB)
+        vram_gb = gpu_ram / 1024 if gpu_ram > 1000 else gpu_ram
+        vram_str = f"{num_gpus}x{int(vram_gb)}G"
+
+    # total_flops is in TFLOPS
+    tflops_str = f"{offer.total_flops:.1f}" if offer.total_flops else "N/A"
+
+    inet_down = offer.inet_down
+    inet_up = offer.inet_up
+    # Convert Mb/s to Gb/s for cleaner display
+    down_str = f"{inet_down/1000:.1f}Gb/s" if inet_down >= 1000 else f"{int(inet_down)}Mb/s"
+    up_str = f"{inet_up/1000:.1f}Gb/s" if inet_up >= 1000 else f"{int(inet_up)}Mb/s"
+
+    reliability = offer.reliability * 100
+
+    return (
+        f"{rank:<4} {offer.disp_id:<8} {offer.disp_type:<6} {offer.disp_gpu:<20} {vram_str:<8} "
+        f"${offer.estimated_total_cost:<7.4f} ${offer.dph:<7.4f} {down_str:<8} {up_str:<8} {offer.disp_geo:<4} "
+        f"{reliability:>4.1f} {tflops_str:<8}\n"
+    )